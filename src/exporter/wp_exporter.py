@@ -771,12 +771,6 @@ class WPExporter:
                             if features_flags:
                                 box_to_sort.content = self.apply_features_flags(box_to_sort.content)
 
-                        # in the parser we can't know the current language.
-                        # we assign a string that we replace with the current language
-                        if box_to_sort.type in (Box.TYPE_PEOPLE_LIST, Box.TYPE_MAP):
-                            if Box.UPDATE_LANG in box_to_sort.content:
-                                box_to_sort.content = box_to_sort.content.replace(Box.UPDATE_LANG, lang)
-
                         contents[lang] += box_to_sort.content
 
                         if not box_to_sort.is_shortcode():
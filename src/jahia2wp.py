@@ -370,8 +370,13 @@ def parse(site, output_dir=None, use_cache=False, **kwargs):
         if use_cache:
             if os.path.exists(pickle_file_path):
                 with open(pickle_file_path, 'rb') as pickle_content:
-                    pickle_site = pickle.load(pickle_content)
-                    logging.info("Using the cached pickle file at %s" % pickle_file_path)
+                    try:
+                        pickle_site = pickle.load(pickle_content)
+                        logging.info("Using the cached pickle file at %s" % pickle_file_path)
+                    # cache may have been saved by an older version of the parser (ie: Box without __slots__)
+                    except Exception as err:
+                        logging.warning("Cannot use the cached pickle file at %s, it will be regenerated: %s",
+                                        pickle_file_path, err)
 
         logging.info("Parsing Jahia xml files from %s...", site_dir)
         if pickle_site:
@@ -1,11 +1,14 @@
 """(c) All rights reserved. ECOLE POLYTECHNIQUE FEDERALE DE LAUSANNE, Switzerland, VPSI, 2017"""
+import functools
 import logging
+import re
 from datetime import datetime
 from urllib import parse
 from urllib.parse import urlencode
-from xml.dom import minidom
 from parser.box_sorted_group import BoxSortedGroup
 from bs4 import BeautifulSoup
+from lxml import etree
+from xml.dom import Node
 from django.utils.text import slugify
 
 from utils import Utils
@@ -14,6 +17,10 @@ from utils import Utils
 class Box:
     """A Jahia Box. Can be of type text, infoscience, etc."""
 
+    # Many boxes are created for a site, so they don't have a __dict__
+    __slots__ = ('site', 'page_content', '_tag_cache', 'type', 'shortcode_name', 'title', 'content', 'sort_group',
+                 'is_in_sidebar', 'shortcode_attributes_to_fix')
+
     # WP box types
     TYPE_TEXT = "text"
     TYPE_ONE_COL_CONTAINER = "oneColContainer"
@@ -65,7 +72,53 @@ class Box:
         "epfl:oneColContainer": TYPE_ONE_COL_CONTAINER
     }
 
-    UPDATE_LANG = "UPDATE_LANG_BY_EXPORTER"
+    # Mapping of WP box types to the method setting the box attributes (except for text boxes, see set_content)
+    content_setters = {
+        TYPE_PEOPLE_LIST: "set_box_people_list",
+        TYPE_INFOSCIENCE: "set_box_infoscience",
+        TYPE_INFOSCIENCE_FILTER: "set_box_infoscience",
+        TYPE_ACTU: "set_box_actu",
+        TYPE_MEMENTO: "set_box_memento",
+        TYPE_FAQ: "set_box_faq",
+        TYPE_TOGGLE: "set_box_toggle",
+        TYPE_INCLUDE: "set_box_include",
+        TYPE_CONTACT: "set_box_contact",
+        TYPE_XML: "set_box_xml",
+        TYPE_LINKS: "set_box_links",
+        TYPE_RSS: "set_box_rss",
+        TYPE_FILES: "set_box_files",
+        TYPE_BUTTONS: "set_box_buttons",
+        TYPE_SNIPPETS: "set_box_snippets",
+        TYPE_SYNTAX_HIGHLIGHT: "set_box_syntax_highlight",
+        TYPE_KEY_VISUAL: "set_box_key_visuals",
+        TYPE_MAP: "set_box_map",
+        TYPE_GRID: "set_box_grid"
+    }
+
+    # Jahia "french" language denominations used in actu.epfl.ch URLs
+    NEWS_LANGUAGES = {'ang': 'en', 'fra': 'fr'}
+
+    # Memento period parameter values, other values are "past"
+    MEMENTO_PERIODS = {'2': 'upcoming'}
+
+    # <a> tag having "twitter-timeline" in its attributes
+    TWITTER_TIMELINE_LINK_REGEX = re.compile(r'<a\s[^>]*twitter-timeline', re.IGNORECASE)
+
+    # Characters the HTML parser considers as whitespaces
+    HTML_WHITESPACES = " \t\n\r\f"
+
+    # <iframe> "src" of videos to replace with a shortcode
+    VIDEO_IFRAME_SRC_REGEX = re.compile(r'youtube\.com|youtu\.be|player\.vimeo\.com')
+
+    PEOPLE_LIST_BASE_URL = "https://people.epfl.ch/cgi-bin/getProfiles?"
+
+    # Mapping of Jahia people list template keys to (WP template, struct parameter). These rules are extracted
+    # from jsp of jahia
+    PEOPLE_LIST_TEMPLATES = {
+        'epfl_peopleListContainer.template.default_bloc': ('default_struct_bloc', 1),
+        'epfl_peopleListContainer.template.default_bloc_simple': ('default_bloc', None),
+        'epfl_peopleListContainer.template.default_list': ('default_list', None)
+    }
 
     def __init__(self, site, page_content, element, multibox=False, is_in_sidebar=False):
         """
@@ -78,6 +131,8 @@ class Box:
         # attributes
         self.site = site
         self.page_content = page_content
+        # first element found for (DOM element, tag name) while parsing, see _get_first_tag
+        self._tag_cache = {}
         self.type = ""
         self.shortcode_name = ""
         self.set_type(element)
@@ -93,6 +148,59 @@ class Box:
         if self.type:
             self.set_content(element, multibox)
 
+        # DOM elements are not needed anymore once the box is parsed, so cache is not kept (nor pickled)
+        del self._tag_cache
+
+    def _get_first_tag(self, dom, tag):
+        """
+        Return first <tag> element found in dom, or None. Element is remembered so looking for the same tag again
+        doesn't walk the DOM again.
+
+        :param dom: DOM element in which to look for tag
+        :param tag: Tag name
+        :return:
+        """
+        key = (dom, tag)
+
+        if key not in self._tag_cache:
+            elements = dom.getElementsByTagName(tag)
+            self._tag_cache[key] = elements[0] if elements else None
+
+        return self._tag_cache[key]
+
+    def _get_tag_attribute(self, dom, tag, attribute):
+        """
+        Same as Utils.get_tag_attribute but the first <tag> element found in dom is remembered, so reading several
+        attributes of the same tag only walks the DOM once.
+
+        :param dom: DOM element in which to look for tag
+        :param tag: Tag name
+        :param attribute: Attribute name
+        :return:
+        """
+        element = self._get_first_tag(dom, tag)
+
+        return element.getAttribute(attribute) if element is not None else ""
+
+    def _cache_tags(self, dom, tags):
+        """
+        Walk dom subtree once to find the first element of each given tag, so the following _get_tag_attribute calls
+        for those tags don't have to walk it again (one walk for each tag).
+
+        :param dom: DOM element in which to look for tags
+        :param tags: Tag names
+        :return:
+        """
+        first_elements = dict.fromkeys(tags)
+
+        for node in dom.getElementsByTagName("*"):
+            tag = node.tagName
+            if tag in first_elements and first_elements[tag] is None:
+                first_elements[tag] = node
+
+        for tag, node in first_elements.items():
+            self._tag_cache[(dom, tag)] = node
+
     def set_sort_infos(self, element):
         """
         Tells if element needs to be sort or not. We check if it has a parent of type "mainList" with a
@@ -101,24 +209,29 @@ class Box:
         :param element: Element to check.
         :return:
         """
-        if element.parentNode.nodeName == 'mainList':
+        parent = element.parentNode
 
-            sort_params = element.parentNode.getAttribute("jahia:sortHandler")
+        if parent.nodeName != 'mainList':
+            return
 
-            # If we have parameters for sorting
-            if sort_params != "":
-                # We get sortHandler uuid to identify it so it will be unique
-                uuid = element.parentNode.getAttribute("jcr:uuid")
-                # Getting (or creating) sortHandler. It may already exists if another box use it.
-                self.sort_group = self.site.get_box_sort_group(uuid, sort_params)
+        sort_params = parent.getAttribute("jahia:sortHandler")
+
+        # If we don't have parameters for sorting
+        if sort_params == "":
+            return
 
-                # Generate name of field in which we have to look for sort value
-                sort_field = "jcr:{}".format(self.sort_group.sort_field)
+        # We get sortHandler uuid to identify it so it will be unique
+        uuid = parent.getAttribute("jcr:uuid")
+        # Getting (or creating) sortHandler. It may already exists if another box use it.
+        self.sort_group = self.site.get_box_sort_group(uuid, sort_params)
 
-                sort_value = element.getAttribute(sort_field)
+        # Generate name of field in which we have to look for sort value
+        sort_field = "jcr:{}".format(self.sort_group.sort_field)
 
-                # Add box to sort handler
-                self.sort_group.add_box_to_sort(self, sort_value)
+        sort_value = element.getAttribute(sort_field)
+
+        # Add box to sort handler
+        self.sort_group.add_box_to_sort(self, sort_value)
 
     def set_type(self, element):
         """
@@ -128,10 +241,9 @@ class Box:
 
         if not type:
             logging.warning("Box has no type")
-        elif type in self.types:
-            self.type = self.types[type]
-        else:
-            self.type = type
+
+        # unknown types are kept as they are
+        self.type = self.types.get(type, type)
 
     def set_content(self, element, multibox=False):
         """set the box attributes"""
@@ -139,80 +251,21 @@ class Box:
         # Init sort handler if needed
         self.set_sort_infos(element)
 
-        # text
+        # text boxes also need to know if they contain several boxes
         if self.type in [self.TYPE_TEXT, self.TYPE_COLORED_TEXT, self.TYPE_ONE_COL_CONTAINER]:
             self.set_box_text(element, multibox)
-        # people list
-        elif self.TYPE_PEOPLE_LIST == self.type:
-            self.set_box_people_list(element)
-        # infoscience
-        elif self.TYPE_INFOSCIENCE == self.type or self.TYPE_INFOSCIENCE_FILTER == self.type:
-            self.set_box_infoscience(element)
-        # actu
-        elif self.TYPE_ACTU == self.type:
-            self.set_box_actu(element)
-        # memento
-        elif self.TYPE_MEMENTO == self.type:
-            self.set_box_memento(element)
-        # faq
-        elif self.TYPE_FAQ == self.type:
-            self.set_box_faq(element)
-        # toggle
-        elif self.TYPE_TOGGLE == self.type:
-            self.set_box_toggle(element)
-        # include
-        elif self.TYPE_INCLUDE == self.type:
-            self.set_box_include(element)
-        # contact
-        elif self.TYPE_CONTACT == self.type:
-            self.set_box_contact(element)
-        # xml
-        elif self.TYPE_XML == self.type:
-            self.set_box_xml(element)
-        # links
-        elif self.TYPE_LINKS == self.type:
-            self.set_box_links(element)
-        # rss
-        elif self.TYPE_RSS == self.type:
-            self.set_box_rss(element)
-        # files
-        elif self.TYPE_FILES == self.type:
-            self.set_box_files(element)
-        # small/bigButtonsBox
-        elif self.TYPE_BUTTONS == self.type:
-            self.set_box_buttons(element)
-        # snippets
-        elif self.TYPE_SNIPPETS == self.type:
-            self.set_box_snippets(element)
-        # syntaxHighlight
-        elif self.TYPE_SYNTAX_HIGHLIGHT == self.type:
-            self.set_box_syntax_highlight(element)
-        # keyVisual
-        elif self.TYPE_KEY_VISUAL == self.type:
-            self.set_box_key_visuals(element)
-        # Map
-        elif self.TYPE_MAP == self.type:
-            self.set_box_map(element)
-        # Grid
-        elif self.TYPE_GRID == self.type:
-            self.set_box_grid(element)
-        # unknown
         else:
-            self.set_box_unknown(element)
+            getattr(self, self.content_setters.get(self.type, "set_box_unknown"))(element)
 
-        self.fix_video_iframes()
-
-        self.add_id_to_h3()
-
-        self.fix_img_align_left()
+        self.fix_content()
 
     def _set_scheduler_box(self, element, content):
         """set the attributes of a scheduler box"""
 
         self.shortcode_name = "epfl_scheduler"
 
-        start_datetime = Utils.get_tag_attribute(element, "comboList", "jahia:validFrom")
-        end_datetime = Utils.get_tag_attribute(element, "comboList", "jahia:validTo")
+        start_datetime = self._get_tag_attribute(element, "comboList", "jahia:validFrom")
+        end_datetime = self._get_tag_attribute(element, "comboList", "jahia:validTo")
 
         if not start_datetime and not end_datetime:
             logging.info("Scheduler has no start date and no end date, simply using content")
@@ -224,15 +277,13 @@ class Box:
         start_time = ""
 
         if "T" in start_datetime:
-            start_date = start_datetime.split("T")[0]
-            start_time = start_datetime.split("T")[1]
+            start_date, start_time = start_datetime.split("T", 1)
 
         end_date = ""
         end_time = ""
 
         if "T" in end_datetime:
-            end_date = end_datetime.split("T")[0]
-            end_time = end_datetime.split("T")[1]
+            end_date, end_time = end_datetime.split("T", 1)
 
         # check if we have a start date in the past and no end date
         if start_date and not end_date:
@@ -275,28 +326,33 @@ class Box:
         # register the shortcodes
         self.site.register_shortcode(shortcode_inner_name, ["link", "image"], self)
 
-        self.content = '[{}]\n'.format(shortcode_outer_name)
+        content = ['[{}]\n'.format(shortcode_outer_name)]
 
         elements = element.getElementsByTagName("gridList")
 
+        # Shortcode name is the same for all elements, so we put it in the template only once
+        inner_shortcode_template = '[{0} layout="{{}}" link="{{}}" title="{{}}" image="{{}}"][/{0}]\n'.format(
+            shortcode_inner_name)
+
         for e in elements:
 
-            layout_infos = Utils.get_tag_attribute(e, "layout", "jahia:value")
-            soup = BeautifulSoup(layout_infos, 'html5lib')
-            layout = soup.find('jahia-resource').get('default-value')
+            self._cache_tags(e, ["layout", "jahia:url", "image"])
+
+            layout = self._get_jahia_resource_default_value(self._get_tag_attribute(e, "layout", "jahia:value"))
 
             # Retrieve info
-            link = Utils.get_tag_attribute(e, "jahia:url", "jahia:value")
-            image = Utils.get_tag_attribute(e, "image", "jahia:value")
-            title = Utils.get_tag_attribute(e, "jahia:url", "jahia:title")
+            link = self._get_tag_attribute(e, "jahia:url", "jahia:value")
+            image = self._get_tag_attribute(e, "image", "jahia:value")
+            title = self._get_tag_attribute(e, "jahia:url", "jahia:title")
 
             # Escape if necessary
-            title = Utils.handle_custom_chars(title)
+            title = self._escape_custom_chars(title)
+
+            content.append(inner_shortcode_template.format(layout, link, title, image))
 
-            self.content += '[{} layout="{}" link="{}" title="{}" image="{}"][/{}]\n'.format(
-                shortcode_inner_name, layout, link, title, image, shortcode_inner_name)
+        content.append("[/{}]".format(shortcode_outer_name))
 
-        self.content += "[/{}]".format(shortcode_outer_name)
+        self.content = ''.join(content)
 
     def set_box_text(self, element, multibox=False):
         """set the attributes of a text box
@@ -309,8 +365,8 @@ class Box:
         """
         def filter_and_transform(box_content):
             """ Sometimes we don't want to crawl the data as it is given"""
-            # for Twitter
-            if 'twitter-timeline' in box_content:
+            # for Twitter. We first look for a twitter-timeline link in raw content to avoid parsing it for nothing
+            if 'twitter-timeline' in box_content and self.TWITTER_TIMELINE_LINK_REGEX.search(box_content):
                 soup = BeautifulSoup(box_content, 'html5lib')
                 links = soup.findAll("a", {"class": "twitter-timeline"})
 
@@ -325,28 +381,30 @@ class Box:
                     box_content = ''.join(['%s' % x for x in soup.body.contents]).strip()
             return box_content
 
+        # Walk element only once to find all the tags we need
+        self._cache_tags(element, ["text", "filesList", "linksList", "comboListList", "comboList"])
+
         if not multibox:
-            content = Utils.get_tag_attribute(element, "text", "jahia:value")
+            content = self._get_tag_attribute(element, "text", "jahia:value")
             content = filter_and_transform(content)
 
-            files_list = element.getElementsByTagName("filesList")
-            if files_list:
-                content += self._parse_files_to_list(files_list[0])
+            files_list = self._get_first_tag(element, "filesList")
+            if files_list is not None:
+                content += self._parse_files_to_list(files_list)
 
-            links_list = element.getElementsByTagName("linksList")
-            if links_list:
-                content += self._parse_links_to_list(links_list[0])
+            links_list = self._get_first_tag(element, "linksList")
+            if links_list is not None:
+                content += self._parse_links_to_list(links_list)
         else:
 
             # Looking for sort information. If found, they looks like :
             # "created;desc;true;true"
-            sort_infos = Utils.get_tag_attribute(element, "comboListList", "jahia:sortHandler")
+            sort_infos = self._get_tag_attribute(element, "comboListList", "jahia:sortHandler")
 
             # If we have information about sorting, we extract them
             if sort_infos != "":
                 # It seems that sort field is corresponding to "jcr:<sort_field>" attribute in XML
-                sort_field = sort_infos.split(";")[0]
-                sort_way = sort_infos.split(";")[1]
+                sort_field, sort_way = sort_infos.split(";", 2)[:2]
             else:
                 # To sort by index to keep the correct order.
                 sort_way = "asc"
@@ -398,39 +456,72 @@ class Box:
                 content += filter_and_transform(box_content)
 
             # scheduler shortcode
-            if Utils.get_tag_attribute(element, "comboList", "jahia:ruleType") == "START_AND_END_DATE":
+            if self._get_tag_attribute(element, "comboList", "jahia:ruleType") == "START_AND_END_DATE":
                 content = self._set_scheduler_box(element, content)
 
         self.content = content
 
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _escape_custom_chars(value):
+        """
+        Escape special characters of a shortcode attribute value (see Utils.handle_custom_chars). The same short values
+        (titles, labels...) are often found in many boxes, so results are cached.
+
+        :param value: value to escape
+        :return:
+        """
+        return Utils.handle_custom_chars(value)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _parse_url_query(url):
+        """
+        Return the (name, value) pairs of the url query string. The same webservice urls are often used in many
+        boxes, so results are cached.
+
+        :param url: URL to parse
+        :return:
+        """
+        return tuple(parse.parse_qsl(parse.urlparse(url).query))
+
+    @staticmethod
+    def _get_first_values(query):
+        """
+        Return a dict with the first value of each parameter of a parsed query string, as parse_qs()[name][0] would
+
+        :param query: (name, value) pairs, as returned by _parse_url_query
+        :return:
+        """
+        parameters = {}
+        for name, value in query:
+            parameters.setdefault(name, value)
+        return parameters
+
     @staticmethod
     def _extract_epfl_news_parameters(url):
         """
         Extract parameters form url
         """
-        parameters = parse.parse_qs(parse.urlparse(url).query)
+        query = Box._parse_url_query(url)
+        parameters = Box._get_first_values(query)
 
         if 'channel' in parameters:
-            channel_id = parameters['channel'][0]
+            channel_id = parameters['channel']
         else:
             channel_id = ""
             logging.error("News Shortcode - channel ID is missing")
 
         if 'lang' in parameters:
-            lang = parameters['lang'][0]
-
             # With Jahia, it is possible to also use "french" language denomination, we change it back to english
-            if lang == 'ang':
-                lang = 'en'
-            if lang == 'fra':
-                lang = 'fr'
+            lang = Box.NEWS_LANGUAGES.get(parameters['lang'], parameters['lang'])
 
         else:
             lang = ""
             logging.warning("News Shortcode - lang is missing")
 
         if 'template' in parameters:
-            template = parameters['template'][0]
+            template = parameters['template']
         else:
             template = ""
             logging.warning("News Shortcode - template is missing")
@@ -443,17 +534,11 @@ class Box:
         else:
             stickers = "yes"
 
-        category = ""
-        if 'category' in parameters:
-            category = parameters['category'][0]
-
-        themes = ""
-        if 'themes' in parameters:
-            themes = parameters['theme']
+        category = parameters.get('category', "")
 
-        projects = ""
-        if 'project' in parameters:
-            projects = parameters['project']
+        # "theme" and "project" parameters can be given several times, we keep all the values
+        themes = [value for name, value in query if name == 'theme']
+        projects = [value for name, value in query if name == 'project']
 
         return channel_id, lang, template, category, themes, stickers, projects
 
@@ -466,13 +551,8 @@ class Box:
         """
         self.shortcode_name = "epfl_people"
 
-        BASE_URL = "https://people.epfl.ch/cgi-bin/getProfiles?"
-
-        # prepare a dictionary with all GET parameters
-        parameters = {}
-
-        # parse the unit parameter
-        parameters['unit'] = Utils.get_tag_attribute(element, "query", "jahia:value")
+        # prepare a dictionary with all GET parameters, starting with the unit parameter
+        parameters = {'unit': Utils.get_tag_attribute(element, "query", "jahia:value")}
 
         # parse the template html
         template_html = Utils.get_tag_attribute(element, "template", "jahia:value")
@@ -490,29 +570,19 @@ class Box:
             return
 
         # extract template key
-        template_key = Utils.get_tag_attribute(
-            minidom.parseString(template_html),
-            "jahia-resource",
-            "key"
-        )
+        jahia_resource = next(etree.fromstring(template_html).iter("jahia-resource"), None)
+        template_key = jahia_resource.get("key", "") if jahia_resource is not None else ""
 
-        # these rules are extracted from jsp of jahia
-        if template_key == 'epfl_peopleListContainer.template.default_bloc':
-            parameters['struct'] = 1
-            template = 'default_struct_bloc'
-        elif template_key == 'epfl_peopleListContainer.template.default_bloc_simple':
-            template = 'default_bloc'
-        elif template_key == 'epfl_peopleListContainer.template.default_list':
-            template = 'default_list'
-        else:
-            template = Utils.get_tag_attribute(minidom.parseString(template_html), "jahia-resource", "key")
+        # unknown templates are used as they are
+        template, struct = self.PEOPLE_LIST_TEMPLATES.get(template_key, (template_key, None))
+
+        if struct:
+            parameters['struct'] = struct
         parameters['tmpl'] = "WP_" + template
 
-        # in the parser we can't know the current language.
-        # so we assign a string that we will replace by the current language in the exporter
-        parameters['lang'] = self.UPDATE_LANG
+        parameters['lang'] = self.page_content.language
 
-        url = "{}{}".format(BASE_URL, urlencode(parameters))
+        url = "{}{}".format(self.PEOPLE_LIST_BASE_URL, urlencode(parameters))
         self.content = '[{} url="{}" /]'.format(self.shortcode_name, url)
 
     def set_box_actu(self, element):
@@ -532,8 +602,8 @@ class Box:
         more_url_list = actu_list_list[0].getElementsByTagName("moreUrl")
 
         if more_url_list:
-            more_url = Utils.get_tag_attribute(more_url_list[0], "jahia:url", "jahia:value")
-            more_title = Utils.get_tag_attribute(more_url_list[0], "jahia:url", "jahia:title")
+            more_url = self._get_tag_attribute(more_url_list[0], "jahia:url", "jahia:value")
+            more_title = self._get_tag_attribute(more_url_list[0], "jahia:url", "jahia:title")
         else:
             more_url = ""
             more_title = ""
@@ -542,104 +612,90 @@ class Box:
         rss_url_list = actu_list_list[0].getElementsByTagName("rssUrl")
 
         if rss_url_list:
-            rss_url = Utils.get_tag_attribute(rss_url_list[0], "jahia:url", "jahia:value")
-            rss_title = Utils.get_tag_attribute(rss_url_list[0], "jahia:url", "jahia:title")
+            rss_url = self._get_tag_attribute(rss_url_list[0], "jahia:url", "jahia:value")
+            rss_title = self._get_tag_attribute(rss_url_list[0], "jahia:url", "jahia:title")
         else:
             rss_url = ""
             rss_title = ""
 
-        content = ""
+        content = []
 
         # Title is only for boxes in pages
         if not self.is_in_sidebar:
-            content += '<h3>{}</h3>'.format(self.title)
+            content.append('<h3>{}</h3>'.format(self.title))
 
-        content += '[{} channel="{}" lang="{}" template="{}" '.format(
+        content.append('[{} channel="{}" lang="{}" template="{}" '.format(
             self.shortcode_name,
             channel_id,
             lang,
             template
-        )
+        ))
         if category:
-            content += 'category="{}" '.format(category)
+            content.append('category="{}" '.format(category))
         if themes:
-            content += 'themes="{}" '.format(",".join(themes))
+            content.append('themes="{}" '.format(",".join(themes)))
         if stickers:
-            content += 'stickers="{}" '.format(stickers)
+            content.append('stickers="{}" '.format(stickers))
         if projects:
-            content += 'projects="{}" '.format(",".join(projects))
+            content.append('projects="{}" '.format(",".join(projects)))
 
-        content += '/]'
+        content.append('/]')
 
         # If we have a <moreUrl> or <rssUrl> element
         if (more_url and more_title) or (rss_url and rss_title):
-            content += '[epfl_buttons_container]'
+            content.append('[epfl_buttons_container]')
 
             if more_url and more_title:
-                content += self._get_button_shortcode('small',
-                                                      more_url,
-                                                      more_title,
-                                                      more_title,
-                                                      small_button_key='forward')
+                content.append(self._get_button_shortcode('small',
+                                                          more_url,
+                                                          more_title,
+                                                          more_title,
+                                                          small_button_key='forward'))
 
             if rss_url and rss_title:
-                content += self._get_button_shortcode('small',
-                                                      rss_url,
-                                                      rss_title,
-                                                      rss_title,
-                                                      small_button_key='forward')
+                content.append(self._get_button_shortcode('small',
+                                                          rss_url,
+                                                          rss_title,
+                                                          rss_title,
+                                                          small_button_key='forward'))
 
-            content += '[/epfl_buttons_container]'
+            content.append('[/epfl_buttons_container]')
 
-        self.content = content
+        self.content = ''.join(content)
 
     @staticmethod
     def _extract_epfl_memento_parameters(url):
         """
         Extract parameters form url
         """
-        parameters = parse.parse_qs(parse.urlparse(url).query)
+        parameters = Box._get_first_values(Box._parse_url_query(url))
 
         if 'memento' in parameters:
-            memento_name = parameters['memento'][0]
+            memento_name = parameters['memento']
         else:
             memento_name = ""
             logging.error("Memento Shortcode - event ID is missing")
 
         if 'lang' in parameters:
-            lang = parameters['lang'][0]
+            lang = parameters['lang']
         else:
             lang = ""
             logging.error("Memento Shortcode - lang is missing")
 
         if 'template' in parameters:
-            template = parameters['template'][0]
+            template = parameters['template']
         else:
             template = ""
             logging.error("Memento Shortcode - template is missing")
 
         period = ""
         if 'period' in parameters:
-            if parameters['period'][0] == "2":
-                period = "upcoming"
-            else:
-                period = "past"
-
-        color = ""
-        if 'color' in parameters:
-            color = parameters['color'][0]
+            period = Box.MEMENTO_PERIODS.get(parameters['period'], "past")
 
-        filters = ""
-        if 'filters' in parameters:
-            filters = parameters['filters'][0]
-
-        category = ""
-        if 'category' in parameters:
-            category = parameters['category'][0]
-
-        reorder = ""
-        if 'reorder' in parameters:
-            reorder = parameters['reorder'][0]
+        color = parameters.get('color', "")
+        filters = parameters.get('filters', "")
+        category = parameters.get('category', "")
+        reorder = parameters.get('reorder', "")
 
         return memento_name, lang, template, period, color, filters, category, reorder
 
@@ -735,24 +791,28 @@ class Box:
         # register the shortcode
         self.site.register_shortcode(shortcode_inner_name, ["link", "image"], self)
 
-        self.content = '[{}]\n'.format(shortcode_outer_name)
+        content = ['[{}]\n'.format(shortcode_outer_name)]
 
         # Looking for entries
         faq_entries = element.getElementsByTagName("faqList")
 
+        # Shortcode name is the same for all entries, so we put it in the template only once
+        inner_shortcode_template = '[{0} question="{{}}"]{{}}[/{0}]\n'.format(shortcode_inner_name)
+
         for entry in faq_entries:
 
             # Get question and escape if necessary
             question = Utils.get_tag_attribute(entry, "question", "jahia:value")
-            question = Utils.handle_custom_chars(question)
+            question = self._escape_custom_chars(question)
 
             # Get answer
             answer = Utils.get_tag_attribute(entry, "answer", "jahia:value")
 
-            self.content += '[{} question="{}"]{}[/{}]\n'.format(
-                shortcode_inner_name, question, answer, shortcode_inner_name)
+            content.append(inner_shortcode_template.format(question, answer))
 
-        self.content += "[/{}]".format(shortcode_outer_name)
+        content.append("[/{}]".format(shortcode_outer_name))
+
+        self.content = ''.join(content)
 
     def set_box_toggle(self, element):
         """set the attributes of a toggle box"""
@@ -865,6 +925,53 @@ class Box:
         """set the attributes of a files box"""
         self.content = self._parse_files_to_list(element)
 
+    @staticmethod
+    def _strip_content_prefix(url):
+        """
+        Remove "/content/sites/<site_name>" prefix from a file URL
+
+        :param url: URL like /content/sites/<site_name>/files/file
+        :return: URL like /files/file
+        """
+        # splitted gives ['', content, sites, <site_name>, files/file], we add the missing '/' in front.
+        parts = url.split("/", 4)
+
+        return '/' + parts[4] if len(parts) == 5 else '/'
+
+    @staticmethod
+    def _get_jahia_resource_default_value(jahia_resource_ref):
+        """
+        Return "default-value" of a Jahia resource reference like:
+        <jahia-resource id="resources.EPFL" key="..." default-value="forward"/>
+
+        :param jahia_resource_ref: Jahia resource reference
+        :return: default value, or "" if not found
+        """
+        # HTML parser is lenient (unclosed tag, upper case tag name...), like BeautifulSoup used to be
+        root = etree.fromstring(jahia_resource_ref, etree.HTMLParser()) if jahia_resource_ref.strip() else None
+        jahia_resource = next(root.iter("jahia-resource"), None) if root is not None else None
+        default_value = jahia_resource.get("default-value") if jahia_resource is not None else None
+
+        if default_value is None:
+            logging.error("No default value found in Jahia resource reference '%s'", jahia_resource_ref)
+            return ""
+
+        return default_value
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _parse_sort_params(sort_params):
+        """
+        Extract sort information from "jahia:sortHandler" parameters of buttons, snippets and links lists. They look
+        like: epfl_simple_main_bigButtonList_url;desc;false;false
+
+        :param sort_params: sort parameters
+        :return: Tuple with name of the tag in which to find sort info ('url' in example) and sort way ('desc')
+        """
+        sort_field, sort_way = sort_params.split(';', 2)[:2]
+
+        return sort_field.rsplit('_', 1)[-1], sort_way
+
     def _get_button_shortcode(self, box_type, url, alt_text, text, big_button_image_url="", small_button_key=""):
         """
         Return shortcode text for EPFL button
@@ -885,8 +992,8 @@ class Box:
             small_button_key = 'key="{}"'.format(small_button_key)
 
         # Replacing necessary characters to ensure everything will work correctly
-        text = Utils.handle_custom_chars(text)
-        alt_text = Utils.handle_custom_chars(alt_text)
+        text = self._escape_custom_chars(text)
+        alt_text = self._escape_custom_chars(alt_text)
 
         return '[epfl_buttons type="{}" url="{}" {} alt_text="{}" text="{}" {}]'.format(box_type,
                                                                                         url,
@@ -934,15 +1041,18 @@ class Box:
         if sort_params != "":
             # Extracting tag name where to find sort info
             # epfl_simple_main_bigButtonList_url;desc;false;false ==> url
-            sort_tag_name = sort_params.split(';')[0].split('_')[-1]
+            sort_tag_name, sort_way = self._parse_sort_params(sort_params)
             sort_tag_name = "jahia:{}".format(sort_tag_name)
 
-            sort_way = sort_params.split(';')[1]
-
         button_boxes = BoxSortedGroup('', '', sort_way)
 
         elements = element.getElementsByTagName(element_name)
 
+        # Those don't change from one button to another
+        get_button_shortcode = functools.partial(self._get_button_shortcode, box_type)
+        language = self.page_content.language
+        pages_by_uuid = self.site.pages_by_uuid
+
         for button_list in elements:
             url = ""
             alt_text = ""
@@ -966,61 +1076,56 @@ class Box:
                 sort_value = len(button_boxes.boxes)
 
             for child in button_list.childNodes:
-                if child.ELEMENT_NODE != child.nodeType:
+                if child.nodeType != Node.ELEMENT_NODE:
                     continue
 
-                if child.tagName == "label":
+                child_tag = child.tagName
+
+                if child_tag == "label":
                     alt_text = child.getAttribute("jahia:value")
 
-                elif child.tagName == "url":
+                elif child_tag == "url":
                     if box_type == 'small':
                         url = child.getAttribute("jahia:value")
 
                     elif box_type == 'big':
                         for jahia_tag in child.childNodes:
-                            if jahia_tag.ELEMENT_NODE != jahia_tag.nodeType:
+                            if jahia_tag.nodeType != Node.ELEMENT_NODE:
                                 continue
 
                             text = jahia_tag.getAttribute("jahia:title")
+                            jahia_tag_name = jahia_tag.tagName
 
-                            if jahia_tag.tagName == "jahia:link":
+                            if jahia_tag_name == "jahia:link":
                                 # It happens that a link references a page that does not exist anymore
                                 # observed on site dii
-                                try:
-                                    page = self.site.pages_by_uuid[jahia_tag.getAttribute("jahia:reference")]
-                                except KeyError as e:
+                                page = pages_by_uuid.get(jahia_tag.getAttribute("jahia:reference"))
+                                if page is None:
                                     continue
 
                                 # We generate "Jahia like" URL so exporter will be able to fix it with WordPress URL
-                                url = "/page-{}-{}.html".format(page.pid, self.page_content.language)
+                                url = "/page-{}-{}.html".format(page.pid, language)
 
-                            elif jahia_tag.tagName == "jahia:url":
+                            elif jahia_tag_name == "jahia:url":
                                 url = jahia_tag.getAttribute("jahia:value")
 
                 # 'image' tag is only used for BigButton
-                elif child.tagName == "image":
-                    # URL is like /content/sites/<site_name>/files/file
-                    # splitted gives ['', content, sites, <site_name>, files, file]
-                    # result of join is files/file and we add the missing '/' in front.
-                    big_button_image_url = '/'.join(child.getAttribute("jahia:value").split("/")[4:])
-                    big_button_image_url = '/' + big_button_image_url
+                elif child_tag == "image":
+                    big_button_image_url = self._strip_content_prefix(child.getAttribute("jahia:value"))
 
                 # 'type' tag is only used for SmallButton and is storing reference to image to display
-                elif child.tagName == "type":
-                    jahia_resource_ref = child.getAttribute("jahia:value")
-                    soup = BeautifulSoup(jahia_resource_ref, "lxml")
-                    small_button_key = soup.find("jahia-resource").get('default-value')
+                elif child_tag == "type":
+                    small_button_key = self._get_jahia_resource_default_value(child.getAttribute("jahia:value"))
 
             if box_type == 'small' and text == "":
                 text = alt_text
 
             # bigButton will have 'image' attribute and smallButton will have 'key' attribute.
-            box_content = self._get_button_shortcode(box_type,
-                                                     url,
-                                                     alt_text,
-                                                     text,
-                                                     big_button_image_url=big_button_image_url,
-                                                     small_button_key=small_button_key)
+            box_content = get_button_shortcode(url,
+                                               alt_text,
+                                               text,
+                                               big_button_image_url=big_button_image_url,
+                                               small_button_key=small_button_key)
 
             # Because boxes can be sortable, we use a BoxSortedGroup to handle this
             button_boxes.add_box_to_sort(box_content, sort_value)
@@ -1043,8 +1148,10 @@ class Box:
         # register the shortcode
         self.site.register_shortcode(self.shortcode_name, ["url", "image", "big_image"], self)
 
+        snippet_list_lists = element.getElementsByTagName("snippetListList")
+
         # check if the list is not empty
-        if not element.getElementsByTagName("snippetListList"):
+        if not snippet_list_lists:
             return
 
         # If box have title, we have to display it
@@ -1053,7 +1160,7 @@ class Box:
         else:
             self.content = ""
 
-        snippet_list_list = element.getElementsByTagName("snippetListList")[0]
+        snippet_list_list = snippet_list_lists[0]
 
         # Sorting parameters
         sort_params = snippet_list_list.getAttribute("jahia:sortHandler")
@@ -1068,16 +1175,18 @@ class Box:
         if sort_params != "":
             # Extracting tag name where to find sort info
             # epfl_simple_main_snippetList_title;desc;false;false ==> url
-            sort_tag_name = sort_params.split(';')[0].split('_')[-1]
-
-            sort_way = sort_params.split(';')[1]
+            sort_tag_name, sort_way = self._parse_sort_params(sort_params)
 
         snippet_boxes = BoxSortedGroup('', '', sort_way)
 
         snippets = snippet_list_list.getElementsByTagName("snippetList")
 
+        # Sort value of each snippet, None if no sorting
+        sort_values = None
+
         # Sorting needed
         if sort_tag_name:
+            sort_values = []
 
             # we first loop through all elements to ensuire we have required sort information
             for snippet in snippets:
@@ -1091,16 +1200,29 @@ class Box:
                     logging.error("No sort tag (%s) found (or empty sort value found) for Snippets. Disabling sorting",
                                   sort_tag_name)
                     # We set to None to disable sorting
-                    sort_tag_name = None
+                    sort_values = None
                     break
 
-        for snippet in snippets:
-            title = Utils.get_tag_attribute(snippet, "title", "jahia:value")
-            subtitle = Utils.get_tag_attribute(snippet, "subtitle", "jahia:value")
-            description = Utils.get_tag_attribute(snippet, "description", "jahia:value")
-            image = Utils.get_tag_attribute(snippet, "image", "jahia:value")
-            big_image = Utils.get_tag_attribute(snippet, "bigImage", "jahia:value")
-            enable_zoom = Utils.get_tag_attribute(snippet, "enableImageZoom", "jahia:value")
+                sort_values.append(sort_value)
+
+        # Those don't change from one snippet to another
+        has_url = bool(element.getElementsByTagName("url"))
+        language = self.page_content.language
+        pages_by_uuid = self.site.pages_by_uuid
+        shortcode_template = '[{0} url="{{}}" title="{{}}" subtitle="{{}}" image="{{}}" big_image="{{}}" ' \
+                             'enable_zoom="{{}}"]{{}}[/{0}]'.format(self.shortcode_name)
+
+        for index, snippet in enumerate(snippets):
+            # Walk snippet only once to find all the tags we need
+            self._cache_tags(snippet, ["title", "subtitle", "description", "image", "bigImage", "enableImageZoom",
+                                       "jahia:url", "jahia:link"])
+
+            title = self._get_tag_attribute(snippet, "title", "jahia:value")
+            subtitle = self._get_tag_attribute(snippet, "subtitle", "jahia:value")
+            description = self._get_tag_attribute(snippet, "description", "jahia:value")
+            image = self._get_tag_attribute(snippet, "image", "jahia:value")
+            big_image = self._get_tag_attribute(snippet, "bigImage", "jahia:value")
+            enable_zoom = self._get_tag_attribute(snippet, "enableImageZoom", "jahia:value")
 
             # Fix path if necessary
             if "/files" in image:
@@ -1109,59 +1231,46 @@ class Box:
                 big_image = big_image[big_image.rfind("/files"):]
 
             # escape
-            title = Utils.handle_custom_chars(title)
-            subtitle = Utils.handle_custom_chars(subtitle)
+            title = self._escape_custom_chars(title)
+            subtitle = self._escape_custom_chars(subtitle)
 
             url = ""
 
             # Sorting needed
-            if sort_tag_name:
-                # We don't have to check if we have a correct value for "sort_tags" because we already did it while
-                # checking sorting information availability
-                sort_tags = snippet.getElementsByTagName(sort_tag_name)
-
-                # It seems that, by default, it is the "jahia:value" value that is used for sorting
-                sort_value = sort_tags[0].getAttribute("jahia:value")
+            if sort_values is not None:
+                # Already extracted while checking sorting information availability
+                sort_value = sort_values[index]
 
             else:
                 # No sorting needed, we generate an ID for the box
                 sort_value = len(snippet_boxes.boxes)
 
             # url
-            if element.getElementsByTagName("url"):
+            if has_url:
                 # first check if we have a <jahia:url> (external url)
-                url = Utils.get_tag_attribute(snippet, "jahia:url", "jahia:value")
+                url = self._get_tag_attribute(snippet, "jahia:url", "jahia:value")
 
                 # if we have an url, set the subtitle with the url title if empty subtitle
                 if url != "":
                     if not subtitle or subtitle == "":
-                        subtitle = Utils.get_tag_attribute(snippet, "jahia:url", "jahia:title")
-                        subtitle = Utils.handle_custom_chars(subtitle)
+                        subtitle = self._get_tag_attribute(snippet, "jahia:url", "jahia:title")
+                        subtitle = self._escape_custom_chars(subtitle)
                 # if not we might have a <jahia:link> (internal url)
                 else:
-                    uuid = Utils.get_tag_attribute(snippet, "jahia:link", "jahia:reference")
+                    uuid = self._get_tag_attribute(snippet, "jahia:link", "jahia:reference")
 
-                    if uuid in self.site.pages_by_uuid:
-                        page = self.site.pages_by_uuid[uuid]
+                    page = pages_by_uuid.get(uuid)
 
+                    if page is not None:
                         # We generate "Jahia like" URL so exporter will be able to fix it with WordPress URL
-                        url = "/page-{}-{}.html".format(page.pid, self.page_content.language)
+                        url = "/page-{}-{}.html".format(page.pid, language)
 
                         # if link has a title, add it to content as ref
-                        url_title = Utils.get_tag_attribute(snippet, "jahia:link", "jahia:title")
+                        url_title = self._get_tag_attribute(snippet, "jahia:link", "jahia:title")
                         if url_title and not url_title == "":
-                            description += '<a href="' + url + '">' + Utils.handle_custom_chars(url_title) + '</a>'
-
-            box_content = '[{} url="{}" title="{}" subtitle="{}" image="{}"' \
-                          ' big_image="{}" enable_zoom="{}"]{}[/{}]'.format(self.shortcode_name,
-                                                                            url,
-                                                                            title,
-                                                                            subtitle,
-                                                                            image,
-                                                                            big_image,
-                                                                            enable_zoom,
-                                                                            description,
-                                                                            self.shortcode_name)
+                            description += '<a href="' + url + '">' + self._escape_custom_chars(url_title) + '</a>'
+
+            box_content = shortcode_template.format(url, title, subtitle, image, big_image, enable_zoom, description)
 
             # Because boxes can be sortable, we use a BoxSortedGroup to handle this
             snippet_boxes.add_box_to_sort(box_content, sort_value)
@@ -1183,18 +1292,13 @@ class Box:
         exporter.
         """
         elements = element.getElementsByTagName("image")
-        content = "<ul>"
+        items = []
         for e in elements:
-            if e.ELEMENT_NODE != e.nodeType:
+            if e.nodeType != Node.ELEMENT_NODE:
                 continue
-            # URL is like /content/sites/<site_name>/files/file
-            # splitted gives ['', content, sites, <site_name>, files, file]
-            # result of join is files/file and we add the missing '/' in front.
-            image_url = '/'.join(e.getAttribute("jahia:value").split("/")[4:])
-            image_url = '/' + image_url
-            content += '<li><img src="{}" /></li>'.format(image_url)
-        content += "</ul>"
-        self.content = content
+            image_url = self._strip_content_prefix(e.getAttribute("jahia:value"))
+            items.append('<li><img src="{}" /></li>'.format(image_url))
+        self.content = "<ul>{}</ul>".format(''.join(items))
 
     def _parse_links_to_list(self, element):
         """Handles link tags that can be found in linksBox and textBox
@@ -1224,15 +1328,16 @@ class Box:
         if sort_params != "":
             # Extracting tag name where to find sort info
             # epfl_simple_main_comboList_links_link;asc;false;false ==> <jahia:link -> jahia:title attribute
-            sort_tag_name = "jahia:{}".format(sort_params.split(';')[0].split('_')[-1])
-
-            sort_way = sort_params.split(';')[1]
+            sort_tag_name, sort_way = self._parse_sort_params(sort_params)
+            sort_tag_name = "jahia:{}".format(sort_tag_name)
 
         links_boxes = BoxSortedGroup('', '', sort_way)
 
+        pages_by_uuid = self.site.pages_by_uuid
+
         elements = element.getElementsByTagName("links")
         for e in elements:
-            if e.ELEMENT_NODE != e.nodeType:
+            if e.nodeType != Node.ELEMENT_NODE:
                 continue
 
             desc = ""
@@ -1255,34 +1360,37 @@ class Box:
 
             # Going through 'linkDesc' and 'link' nodes
             for link_node in e.childNodes:
-                if link_node.ELEMENT_NODE != link_node.nodeType:
+                if link_node.nodeType != Node.ELEMENT_NODE:
                     continue
 
-                if link_node.tagName == "linkDesc":
+                link_node_name = link_node.tagName
+
+                if link_node_name == "linkDesc":
                     desc = link_node.getAttribute("jahia:value")
-                elif link_node.tagName == "link":
+                elif link_node_name == "link":
 
                     # Going through node containing link. It can be 'jahia:link' or 'jahia:url' node.
                     for jahia_tag in link_node.childNodes:
-                        if jahia_tag.ELEMENT_NODE != jahia_tag.nodeType:
+                        if jahia_tag.nodeType != Node.ELEMENT_NODE:
                             continue
 
-                        if jahia_tag.tagName in ['jahia:link', 'jahia:url']:
+                        jahia_tag_name = jahia_tag.tagName
+
+                        if jahia_tag_name in ['jahia:link', 'jahia:url']:
                             title = jahia_tag.getAttribute("jahia:title")
 
-                        if jahia_tag.tagName == "jahia:link":
+                        if jahia_tag_name == "jahia:link":
 
                             # It happens that a link references a page that does not exist anymore
                             # observed on site dii
-                            try:
-                                page = self.site.pages_by_uuid[jahia_tag.getAttribute("jahia:reference")]
-                            except KeyError as e:
+                            page = pages_by_uuid.get(jahia_tag.getAttribute("jahia:reference"))
+                            if page is None:
                                 continue
 
                             # We generate "Jahia like" URL so exporter will be able to fix it with WordPress URL
                             url = "/page-{}-{}.html".format(page.pid, self.page_content.language)
 
-                        elif jahia_tag.tagName == "jahia:url":
+                        elif jahia_tag_name == "jahia:url":
                             url = jahia_tag.getAttribute("jahia:value")
 
             link_html = '<li><a href="{}">{}</a>{}</li>'.format(url, title, desc)
@@ -1290,12 +1398,12 @@ class Box:
             # Because boxes can be sortable, we use a BoxSortedGroup to handle this
             links_boxes.add_box_to_sort(link_html, sort_value)
 
-        content = "<ul>{}</ul>".format(''.join(links_boxes.get_sorted_boxes()))
+        links = links_boxes.get_sorted_boxes()
 
-        if content == "<ul></ul>":
-            content = ""
+        if not links:
+            return ""
 
-        return content
+        return "<ul>{}</ul>".format(''.join(links))
 
     def _parse_files_to_list(self, element):
         """Handles files tags that can be found in linksBox and textBox
@@ -1313,23 +1421,18 @@ class Box:
         Maybe if value is set to 'true', we have to display content of 'fileDesc' property somewhere
         """
         elements = element.getElementsByTagName("file")
-        content = "<ul>"
+        items = []
         for e in elements:
-            if e.ELEMENT_NODE != e.nodeType:
+            if e.nodeType != Node.ELEMENT_NODE:
                 continue
-            # URL is like /content/sites/<site_name>/files/file
-            # splitted gives ['', content, sites, <site_name>, files, file]
-            # result of join is files/file and we add the missing '/' in front.
-            file_url = '/'.join(e.getAttribute("jahia:value").split("/")[4:])
-            file_url = '/' + file_url
-            file_name = file_url.split("/")[-1]
-            content += '<li><a href="{}">{}</a></li>'.format(file_url, file_name)
-        content += "</ul>"
-
-        if content == "<ul></ul>":
-            content = ""
+            file_url = self._strip_content_prefix(e.getAttribute("jahia:value"))
+            file_name = file_url.rsplit("/", 1)[-1]
+            items.append('<li><a href="{}">{}</a></li>'.format(file_url, file_name))
+
+        if not items:
+            return ""
 
-        return content
+        return "<ul>{}</ul>".format(''.join(items))
 
     def set_box_map(self, element):
         """set the attributes of a map box"""
@@ -1339,78 +1442,87 @@ class Box:
         # parse info
         query = Utils.get_tag_attribute(element, "query", "jahia:value")
 
-        # in the parser we can't know the current language.
-        # so we assign a string that we will replace by the current language in the exporter
-        lang = self.UPDATE_LANG
-
-        self.content = '[{} query="{}" lang="{}"]'.format(self.shortcode_name, query, lang)
+        self.content = '[{} query="{}" lang="{}"]'.format(self.shortcode_name, query, self.page_content.language)
 
-    def fix_img_align_left(self):
+    def fix_content(self):
         """
-        Look for <img> having attribute "align" with value set to "left", delete it and add a "class='left'" instead
-        This is done because, on Jahia, there's a mechanism (but we don't know where) which do this on the client side.
+        Apply the HTML fixes to box content. Content is parsed only once for all the fixes.
         :return:
         """
+        # Nothing to fix, and no need to run the parser, if there's only (HTML) whitespace
+        if not self.content.strip(self.HTML_WHITESPACES):
+            self.content = ""
+            return
+
         soup = BeautifulSoup(self.content, 'html5lib')
         soup.body.hidden = True
 
-        images = soup.find_all('img')
-
-        for img in images:
+        self.fix_video_iframes(soup)
 
-            align = img.get('align')
+        self.add_id_to_h3(soup)
 
-            if align and align == 'left':
-                img['class'] = 'left'
-                del img['align']
+        self.fix_img_align_left(soup)
 
         self.content = str(soup.body)
 
-    def fix_video_iframes(self):
+    def fix_img_align_left(self, soup):
+        """
+        Look for <img> having attribute "align" with value set to "left", delete it and add a "class='left'" instead
+        This is done because, on Jahia, there's a mechanism (but we don't know where) which do this on the client side.
+        :param soup: BeautifulSoup of box content
+        :return:
+        """
+        images = soup.find_all('img', align='left')
+
+        for img in images:
+            img['class'] = 'left'
+            del img['align']
+
+    def fix_video_iframes(self, soup):
         """
         Look for :
             <iframe src="https://www.youtube.com...
             <iframe src="https://player.vimeo.com/video/...
 
         and replace with a shortcode
+        :param soup: BeautifulSoup of box content
         :return:
         """
-        soup = BeautifulSoup(self.content, 'html5lib')
-        soup.body.hidden = True
-
-        iframes = soup.find_all('iframe')
+        iframes = soup.find_all('iframe', src=self.VIDEO_IFRAME_SRC_REGEX)
 
         for iframe in iframes:
 
-            src = iframe.get('src')
-
-            if src and ('youtube.com' in src or 'youtu.be' in src or 'player.vimeo.com' in src):
+            shortcode = '[epfl_video url="{}"]'.format(iframe['src'])
+            # Replacing the iframe with shortcode text
+            iframe.replaceWith(shortcode)
 
-                shortcode = '[epfl_video url="{}"]'.format(src)
-                # Replacing the iframe with shortcode text
-                iframe.replaceWith(shortcode)
+    @staticmethod
+    @functools.lru_cache(maxsize=2048)
+    def _slugify(text):
+        """
+        Return slugified text. The same titles are often found in many boxes (sidebar ones for example), so results
+        are cached.
 
-        self.content = str(soup.body)
+        :param text: text to slugify
+        :return:
+        """
+        return slugify(text)
 
-    def add_id_to_h3(self):
+    def add_id_to_h3(self, soup):
         """
         Take title of <h3> elements, slugify it and add it as "id" attribute
+        :param soup: BeautifulSoup of box content
         :return:
         """
-
-        soup = BeautifulSoup(self.content, 'html5lib')
-        soup.body.hidden = True
-
-        h3s = soup.find_all('h3')
+        # Only <h3> without id
+        h3s = soup.find_all('h3', id=False)
 
         for h3 in h3s:
 
-            if h3.text != "" and h3.get('id') is None:
-                slug = slugify(h3.text)
+            if h3.text != "":
+                slug = self._slugify(h3.text)
                 h3['id'] = slug
 
-        self.content = str(soup.body)
-
     def is_shortcode(self):
         return self.shortcode_name != ""
 
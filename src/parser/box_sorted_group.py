@@ -6,6 +6,8 @@ from collections import OrderedDict
 class BoxSortedGroup:
     """ To group boxes that have to be sort using on of their property field """
 
+    __slots__ = ('uuid', 'sort_field', 'sort_way', 'boxes')
+
     def __init__(self, uuid, sort_field, sort_way):
         """
         Class constructor
@@ -1,7 +1,11 @@
 import os
+from types import SimpleNamespace
+from xml.dom import minidom
+from xml.sax.saxutils import quoteattr
 
 import pytest
 
+from parser.box import Box
 from parser.jahia_site import Site
 from parser.test import Data
 from settings import DATA_PATH
@@ -189,3 +193,93 @@ class TestPages:
                 box_type = [box.type for box in boxes]
                 expected_type = [data_box['type'] for data_box in expected_boxes]
                 assert box_type == expected_type
+
+
+class TestBoxContent:
+    """
+      Check HTML fixes applied to box content
+    """
+
+    @staticmethod
+    def get_text_box_content(html):
+        xml = '<main xmlns:jcr="http://www.jcp.org/jcr/1.0" xmlns:jahia="http://www.jahia.org/" ' \
+              'jcr:primaryType="epfl:textBox"><text jahia:value={}/></main>'.format(quoteattr(html))
+
+        return Box(site=None, page_content=None, element=minidom.parseString(xml).documentElement).content
+
+    def test_empty_content(self):
+        assert self.get_text_box_content("") == ""
+        assert self.get_text_box_content(" \n\t") == ""
+
+    def test_misnested_markup(self):
+        assert self.get_text_box_content("<b><p>Important</b> notice</p>") == "<b></b><p><b>Important</b> notice</p>"
+
+    def test_misnested_markup_with_twitter(self):
+        script = '<script>!function(d,s,id){}(document,"script","twitter-wjs");</script>'
+        content = self.get_text_box_content('<div><b>Bold <i>it</b> rest</i></div>'
+                                            '<a class="twitter-timeline" href="https://twitter.com/epfl">Tweets</a>' +
+                                            script)
+
+        assert content == '<div><b>Bold <i>it</i></b><i> rest</i></div>' \
+                          '[epfl_twitter url="https://twitter.com/epfl"]\n' + script
+
+    def test_fixes(self):
+        content = self.get_text_box_content('<h3>My title</h3><h3 id="keep">Other</h3>'
+                                            '<img src="a.png" align="left"/><img src="b.png" align="right"/>'
+                                            '<iframe src="https://www.youtube.com/embed/x"></iframe>'
+                                            '<iframe src="https://example.com/x"></iframe>')
+
+        assert content == '<h3 id="my-title">My title</h3><h3 id="keep">Other</h3>' \
+                          '<img class="left" src="a.png"/><img align="right" src="b.png"/>' \
+                          '[epfl_video url="https://www.youtube.com/embed/x"]' \
+                          '<iframe src="https://example.com/x"></iframe>'
+
+
+class TestBoxParameters:
+    """
+      Check parameters extracted from webservices URLs
+    """
+
+    NEWS_URL = "https://actu.epfl.ch/webservice_iframe/?channel=1&lang=en&template=2"
+
+    def test_news_theme_only(self):
+        themes = Box._extract_epfl_news_parameters(self.NEWS_URL + "&theme=4&theme=5")[4]
+        assert themes == ["4", "5"]
+
+    def test_news_themes_only(self):
+        themes = Box._extract_epfl_news_parameters(self.NEWS_URL + "&themes=1")[4]
+        assert themes == []
+
+    def test_news_theme_and_themes(self):
+        themes = Box._extract_epfl_news_parameters(self.NEWS_URL + "&themes=1&theme=4")[4]
+        assert themes == ["4"]
+
+    def test_news_projects(self):
+        projects = Box._extract_epfl_news_parameters(self.NEWS_URL + "&project=6&project=7")[6]
+        assert projects == ["6", "7"]
+
+
+class TestBoxLanguage:
+    """
+      Check page language is set in shortcodes needing it
+    """
+
+    @staticmethod
+    def get_box(primary_type, children):
+        xml = '<main xmlns:jcr="http://www.jcp.org/jcr/1.0" xmlns:jahia="http://www.jahia.org/" ' \
+              'jcr:primaryType="{}">{}</main>'.format(primary_type, children)
+
+        return Box(site=None, page_content=SimpleNamespace(language="de"),
+                   element=minidom.parseString(xml).documentElement)
+
+    def test_map(self):
+        box = self.get_box("epfl:mapBox", '<query jahia:value="INN 011"/>')
+
+        assert box.content == '[epfl_map query="INN 011" lang="de"]'
+
+    def test_people_list(self):
+        template = quoteattr('<jahia-resource key="epfl_peopleListContainer.template.default_list"/>')
+        box = self.get_box("epfl:peopleListBox",
+                           '<query jahia:value="unit1"/><template jahia:value={}/>'.format(template))
+
+        assert 'lang=de' in box.content